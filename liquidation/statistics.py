@@ -4,130 +4,302 @@ Liquidation Data Visualization Script
 Creates monthly revenue charts from liquidation data
 """
 
+import argparse
 import json
+import os
+import sys
+import tempfile
 import pandas as pd
+import matplotlib
+
+# Use the non-interactive Agg backend when there is no X11/Wayland display (CI / batch runs),
+# unless a backend was chosen explicitly through MPLBACKEND
+if (sys.platform.startswith('linux') and 'MPLBACKEND' not in os.environ
+        and not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY')):
+    matplotlib.use('Agg')
+
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-from datetime import datetime, timezone
+from matplotlib import font_manager
 import seaborn as sns
 from pathlib import Path
 import numpy as np
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+    # ijson's C (yajl) backends overflow on wei amounts wider than int64;
+    # the pure-Python backend keeps them as arbitrary-precision ints
+    ijson_backend = ijson.get_backend('python')
+except ImportError:
+    ijson = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    from pyarrow import ArrowException
+except ImportError:
+    ArrowException = None
+
+JSON_ERRORS = (json.JSONDecodeError,) + ((ijson.JSONError,) if ijson else ())
+
+# Failures that only skip the Parquet side-cache write (missing pyarrow, read-only or full
+# directory, codec not built into pyarrow) rather than aborting an otherwise good load
+CACHE_WRITE_ERRORS = (ImportError, OSError, ValueError, NotImplementedError) + \
+    ((ArrowException,) if ArrowException else ())
+
+# Files larger than this are streamed with ijson instead of being loaded whole
+STREAM_THRESHOLD_BYTES = 512 * 1024 * 1024
+
+# Columns the processing/analysis steps actually use; only these are loaded and cached
+NEEDED_COLUMNS = ['blockTimestamp', 'revenue', 'marketId', 'transactionHash']
+
+# Column dtypes for DataFrame construction; wei revenue can exceed int64 so it stays object
+COLUMN_DTYPES = {
+    'blockTimestamp': np.int64,
+    'revenue': object,
+    'marketId': object,
+    'transactionHash': object,
+}
+
+# Set chart style once for all chart functions - use default matplotlib style for compatibility.
+# Layout is computed explicitly per figure, and long paths are simplified and chunked when rendered.
+plt.style.use('default')
+sns.set_theme(style="whitegrid")
+matplotlib.rcParams.update({
+    'figure.autolayout': False,
+    'path.simplify_threshold': 1.0,
+    'agg.path.chunksize': 10000,
+})
+# Resolve the chart font once up front so the first chart does not pay for the font lookup
+font_manager.findfont('DejaVu Sans')
+
+def to_columns(data):
+    """Convert a list of log records into a dict of per-column NumPy arrays
+    
+    Only NEEDED_COLUMNS are projected; Morpho/Euler logs carry many more fields.
+    """
+    keys = [k for k in NEEDED_COLUMNS if k in data[0]]
+    return {k: np.fromiter((d.get(k) for d in data), dtype=COLUMN_DTYPES.get(k, object), count=len(data))
+            for k in keys}
+
+def stream_columns(f, chunk_size=1 << 17):
+    """Stream log records with ijson into per-column NumPy arrays
+    
+    Records are copied into fixed-size chunk buffers, so the working set is bounded by
+    chunk_size records rather than by the whole tree of parsed dicts.
+    """
+    chunks, buffers, keys = {}, {}, []
+    n = 0
+    for record in ijson_backend.items(f, 'item', use_float=True):
+        if not keys:
+            keys = [k for k in NEEDED_COLUMNS if k in record]
+            chunks = {k: [] for k in keys}
+        if n == 0:
+            buffers = {k: np.empty(chunk_size, dtype=COLUMN_DTYPES.get(k, object)) for k in keys}
+        for k in keys:
+            buffers[k][n] = record.get(k)
+        n += 1
+        if n == chunk_size:
+            for k in keys:
+                chunks[k].append(buffers[k])
+            n = 0
+    
+    for k in keys:
+        chunks[k].append(buffers[k][:n])
+    return {k: np.concatenate(chunks[k]) for k in keys}
+
 def load_data(file_path):
-    """Load liquidation data from JSON file"""
+    """Load liquidation data as a DataFrame, using a Parquet side-cache when available"""
+    parquet_path = Path(file_path).with_suffix('.parquet')
+    if parquet_path.exists() and (not Path(file_path).exists()
+                                  or parquet_path.stat().st_mtime >= Path(file_path).stat().st_mtime):
+        try:
+            df = pd.read_parquet(parquet_path)
+            print(f"Loaded {len(df)} records from {parquet_path}")
+            return df
+        except Exception as e:
+            print(f"Unreadable Parquet cache {parquet_path} ({e}), falling back to JSON")
+    
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        print(f"Loaded {len(data)} records from {file_path}")
-        return data
+        with open(file_path, 'rb') as f:
+            if ijson and os.path.getsize(file_path) > STREAM_THRESHOLD_BYTES:
+                columns = stream_columns(f)
+            else:
+                data = orjson.loads(f.read()) if orjson else json.load(f)
+                columns = to_columns(data) if data else {}
     except FileNotFoundError:
         print(f"File not found: {file_path}")
-        return []
-    except json.JSONDecodeError:
+        return pd.DataFrame()
+    except JSON_ERRORS:  # orjson.JSONDecodeError subclasses json.JSONDecodeError
         print(f"Invalid JSON in file: {file_path}")
-        return []
+        return pd.DataFrame()
+    
+    df = pd.DataFrame(columns)
+    print(f"Loaded {len(df)} records from {file_path}")
+    if df.empty:
+        return df
+    
+    # Write the cache for subsequent runs
+    # Wei amounts do not fit in int64 and are only ever used as float64 ETH, so cache them as float64
+    cache = df.copy()
+    cache['revenue'] = cache['revenue'].to_numpy(dtype=np.float64)
+    # Write to a temp file and rename it into place so an interrupted write never
+    # leaves a truncated cache that looks newer than the JSON
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=parquet_path.parent, suffix='.parquet.tmp')
+        os.close(fd)
+        cache.to_parquet(tmp_path, compression='zstd', index=False)
+        os.replace(tmp_path, parquet_path)
+        print(f"Cached {len(cache)} records to {parquet_path}")
+    except CACHE_WRITE_ERRORS as e:
+        print(f"Skipping Parquet cache {parquet_path} ({e})")
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    return df
+
+def month_index(dates):
+    """Map datetimes to a dense month index and return it with the datetime64[M] months it indexes"""
+    # .values of a UTC datetime column is naive UTC datetime64, so the month cast needs no tz handling
+    months = dates.values.astype('datetime64[M]')
+    first_month = months.min()
+    month_idx = (months - first_month).astype(np.int64)
+    return month_idx, np.arange(first_month, months.max() + 1)
 
-def convert_timestamp_to_date(timestamp):
-    """Convert Unix timestamp to datetime"""
-    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+def _aggregate_month_market_loop(month_idx, market_codes, revenue, n_months, n_markets):
+    """Sum revenue per market and per (month, market) cell in a single sweep"""
+    totals = np.zeros(n_markets)
+    monthly = np.zeros((n_months, n_markets))
+    for i in range(revenue.size):
+        m = month_idx[i]
+        k = market_codes[i]
+        v = revenue[i]
+        totals[k] += v
+        monthly[m, k] += v
+    return totals, monthly
 
-def process_data(data):
+_aggregate_month_market_jit = njit(cache=True)(_aggregate_month_market_loop) if njit else None
+
+def aggregate_month_market(month_idx, market_codes, revenue, n_months, n_markets):
+    """Return per-market revenue totals and a dense (month x market) revenue table
+    
+    Uses a numba-compiled single pass when numba is installed. Otherwise each record's
+    (month, market) cell is flattened to one index and summed with a single bincount.
+    """
+    if _aggregate_month_market_jit is not None:
+        return _aggregate_month_market_jit(month_idx, market_codes, revenue, n_months, n_markets)
+    
+    cell_idx = month_idx * n_markets + market_codes
+    monthly = np.bincount(cell_idx, weights=revenue, minlength=n_months * n_markets).reshape(n_months, n_markets)
+    return monthly.sum(axis=0), monthly
+
+def process_data(df):
     """Process data and create monthly aggregates"""
-    if not data:
-        return pd.DataFrame()
-    
-    # Convert to DataFrame
-    df = pd.DataFrame(data)
+    if df.empty:
+        return pd.DataFrame(), df
     
-    # Convert blockTimestamp to datetime
-    df['date'] = df['blockTimestamp'].apply(convert_timestamp_to_date)
+    df = df.copy()
     
-    # Extract month and year
-    df['month_year'] = df['date'].dt.to_period('M')
+    # Convert blockTimestamp to datetime (vectorized over the whole column)
+    df['date'] = pd.to_datetime(df['blockTimestamp'], unit='s', utc=True)
     
-    # Convert revenue to ETH (assuming revenue is in wei)
-    df['revenue_eth'] = df['revenue'] / 1e18
+    # Convert revenue to ETH (assuming revenue is in wei) with one float64 pass
+    # instead of a per-element divide over the object column of Python ints
+    revenue = df['revenue'].to_numpy(dtype=np.float64)
+    df['revenue_eth'] = revenue * 1e-18
     
-    # Group by month and sum revenue
-    monthly_revenue = df.groupby('month_year')['revenue_eth'].sum().reset_index()
-    monthly_revenue['month_year'] = monthly_revenue['month_year'].astype(str)
+    # Sum revenue per month with a single bincount instead of a hashed groupby
+    month_idx, months = month_index(df['date'])
+    sums = np.bincount(month_idx, weights=df['revenue_eth'].to_numpy(), minlength=len(months))
     
-    # Convert month_year back to datetime for plotting
-    monthly_revenue['date'] = monthly_revenue['month_year'].dt.to_timestamp()
+    monthly_revenue = pd.DataFrame({
+        'month_year': np.datetime_as_string(months, unit='M'),
+        'revenue_eth': sums,
+        'date': pd.DatetimeIndex(months),
+    })
     
     return monthly_revenue, df
 
-def process_morpho_data(data):
+def process_morpho_data(df):
     """Process Morpho data with marketId grouping and ranking"""
-    if not data:
-        return pd.DataFrame(), pd.DataFrame()
-    
-    # Convert to DataFrame
-    df = pd.DataFrame(data)
-    
-    # Convert blockTimestamp to datetime
-    df['date'] = df['blockTimestamp'].apply(convert_timestamp_to_date)
-    
-    # Extract month and year
-    df['month_year'] = df['date'].dt.to_period('M')
-    
-    # Convert revenue to ETH (assuming revenue is in wei)
-    df['revenue_eth'] = df['revenue'] / 1e18
-    
-    # 1. Sum up total revenue of each marketId
-    market_revenue = df.groupby('marketId')['revenue_eth'].sum().reset_index()
-    
-    # 2. Rank marketIds in revenue descending order
-    market_revenue = market_revenue.sort_values('revenue_eth', ascending=False).reset_index(drop=True)
+    if df.empty:
+        return pd.DataFrame(), df, []
+    
+    df = df.copy()
+    
+    # Convert blockTimestamp to datetime (vectorized over the whole column)
+    df['date'] = pd.to_datetime(df['blockTimestamp'], unit='s', utc=True)
+    
+    # Convert revenue to ETH (assuming revenue is in wei) with one float64 pass
+    # instead of a per-element divide over the object column of Python ints
+    revenue = df['revenue'].to_numpy(dtype=np.float64)
+    df['revenue_eth'] = revenue * 1e-18
+    
+    # Cast marketId to categorical once so grouping and column mapping below work
+    # on small integer codes instead of re-hashing the 66-char hex strings
+    df['marketId'] = df['marketId'].astype('category')
+    
+    # 1. Accumulate per-market totals and the dense (month x market code) table in one pass.
+    # Records with a null marketId (category code -1) are dropped, as groupby would; numba
+    # would otherwise wrap -1 onto the last market's column.
+    market_codes = df['marketId'].cat.codes.to_numpy()
+    has_market = market_codes >= 0
+    if not has_market.any():
+        return pd.DataFrame(), df, []
+    market_codes = market_codes[has_market]
+    month_idx, months = month_index(df['date'][has_market])
+    categories = df['marketId'].cat.categories
+    totals, monthly = aggregate_month_market(month_idx, market_codes, df['revenue_eth'].to_numpy()[has_market],
+                                             len(months), len(categories))
+    
+    # 2. Rank marketIds by total revenue in descending order
+    order = np.argsort(-totals, kind='stable')
+    market_revenue = pd.DataFrame({'marketId': categories[order], 'revenue_eth': totals[order]})
     
     print(f"\n=== MARKET REVENUE RANKING ===")
-    for i, row in market_revenue.iterrows():
-        print(f"{i+1}. Market {row['marketId'][:10]}... | Revenue: {row['revenue_eth']:.6f} ETH")
+    lines = [f"{i+1}. Market {market_id[:10]}... | Revenue: {revenue_eth:.6f} ETH"
+             for i, (market_id, revenue_eth) in enumerate(zip(market_revenue['marketId'].to_numpy(),
+                                                             market_revenue['revenue_eth'].to_numpy()))]
+    print('\n'.join(lines))
     
     # 3. Get top 5 marketIds
-    top_5_markets = market_revenue.head(5)['marketId'].tolist()
-    
-    # 4. Create monthly data with top 5 markets + others
-    monthly_market_data = df.groupby(['month_year', 'marketId'])['revenue_eth'].sum().reset_index()
-    
-    # 5. Pivot data to have markets as columns
-    monthly_pivot = monthly_market_data.pivot(index='month_year', columns='marketId', values='revenue_eth').fillna(0)
+    top_codes = order[:5]
+    top_5_markets = categories[top_codes].tolist()
     
-    # 6. Group non-top-5 markets into "Others"
-    other_markets = [col for col in monthly_pivot.columns if col not in top_5_markets]
-    if other_markets:
-        monthly_pivot['Others'] = monthly_pivot[other_markets].sum(axis=1)
-        monthly_pivot = monthly_pivot.drop(columns=other_markets)
+    # 4. Select the top 5 columns and collapse the rest into "Others" (only if there are any)
+    columns = {market: monthly[:, code] for market, code in zip(top_5_markets, top_codes)}
+    if len(categories) > len(top_codes):
+        other_mask = np.ones(len(categories), dtype=bool)
+        other_mask[top_codes] = False
+        columns['Others'] = monthly[:, other_mask].sum(axis=1)
     
-    # 7. Ensure we have all top 5 markets (fill missing with 0)
-    for market in top_5_markets:
-        if market not in monthly_pivot.columns:
-            monthly_pivot[market] = 0
-    
-    # 8. Reorder columns to have Others last
-    if 'Others' in monthly_pivot.columns:
-        columns_order = top_5_markets + ['Others']
-    else:
-        columns_order = top_5_markets
-    
-    monthly_pivot = monthly_pivot[columns_order]
-    
-    # 9. Convert month_year back to datetime for plotting
-    monthly_pivot = monthly_pivot.reset_index()
-    monthly_pivot['date'] = monthly_pivot['month_year'].dt.to_timestamp()
+    monthly_pivot = pd.DataFrame({'month_year': np.datetime_as_string(months, unit='M'), **columns,
+                                  'date': pd.DatetimeIndex(months)})
     
     return monthly_pivot, df, top_5_markets
 
+def show_and_close(fig):
+    """Show a saved chart when running interactively with a GUI backend, then close it"""
+    if sys.stdout.isatty() and matplotlib.get_backend().lower() != 'agg':
+        plt.show()
+    plt.close(fig)
+
 def create_monthly_chart(monthly_data, output_dir="charts"):
     """Create monthly revenue column chart"""
     if monthly_data.empty:
         print("No data to plot")
         return
     
-    # Set style - use default matplotlib style for compatibility
-    plt.style.use('default')
-    sns.set_theme(style="whitegrid")
-    
     # Create figure
     fig, ax = plt.subplots(figsize=(16, 10))
     
@@ -157,7 +329,7 @@ def create_monthly_chart(monthly_data, output_dir="charts"):
     ax.grid(True, alpha=0.3, axis='y')
     
     # Adjust layout
-    plt.tight_layout()
+    fig.tight_layout(pad=1.5)
     
     # Create output directory
     Path(output_dir).mkdir(exist_ok=True)
@@ -167,8 +339,7 @@ def create_monthly_chart(monthly_data, output_dir="charts"):
     plt.savefig(output_path, dpi=300, bbox_inches='tight')
     print(f"Chart saved to: {output_path}")
     
-    # Show chart
-    plt.show()
+    show_and_close(fig)
 
 def create_morpho_monthly_chart(monthly_data, top_5_markets, output_dir="charts"):
     """Create monthly revenue stacked column chart for Morpho data with top 5 markets + others"""
@@ -176,10 +347,6 @@ def create_morpho_monthly_chart(monthly_data, top_5_markets, output_dir="charts"
         print("No data to plot")
         return
     
-    # Set style - use default matplotlib style for compatibility
-    plt.style.use('default')
-    sns.set_theme(style="whitegrid")
-    
     # Create figure
     fig, ax = plt.subplots(figsize=(18, 12))
     
@@ -221,7 +388,7 @@ def create_morpho_monthly_chart(monthly_data, top_5_markets, output_dir="charts"
     ax.grid(True, alpha=0.3, axis='y')
     
     # Adjust layout to accommodate legend
-    plt.tight_layout()
+    fig.tight_layout(pad=1.5)
     
     # Create output directory
     Path(output_dir).mkdir(exist_ok=True)
@@ -231,8 +398,7 @@ def create_morpho_monthly_chart(monthly_data, top_5_markets, output_dir="charts"
     plt.savefig(output_path, dpi=300, bbox_inches='tight')
     print(f"Chart saved to: {output_path}")
     
-    # Show chart
-    plt.show()
+    show_and_close(fig)
 
 def create_detailed_analysis(df):
     """Create detailed analysis of the data"""
@@ -251,54 +417,86 @@ def create_detailed_analysis(df):
     # Top 10 liquidations by revenue
     print("\n=== TOP 10 LIQUIDATIONS BY REVENUE ===")
     top_10 = df.nlargest(10, 'revenue_eth')[['date', 'transactionHash', 'revenue_eth']]
-    for _, row in top_10.iterrows():
-        print(f"{row['date'].strftime('%Y-%m-%d %H:%M')} | {row['transactionHash'][:10]}... | {row['revenue_eth']:.6f} ETH")
+    lines = [f"{r.date:%Y-%m-%d %H:%M} | {r.transactionHash[:10]}... | {r.revenue_eth:.6f} ETH"
+             for r in top_10.itertuples(index=False)]
+    print('\n'.join(lines))
 
-def create_additional_charts(df, output_dir="charts"):
-    """Create additional visualization charts"""
+def create_additional_charts(df, output_dir="charts", axes=None):
+    """Create daily revenue trend and revenue distribution charts on a shared figure
+    
+    If axes (a pair of Axes) is given, plot onto it and leave saving to the caller.
+    """
     if df.empty:
         return
     
-    # Create output directory
-    Path(output_dir).mkdir(exist_ok=True)
+    if axes is None:
+        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(26, 6))
+    else:
+        ax1, ax2 = axes
+        fig = None
     
     # 1. Daily revenue trend
     daily_revenue = df.groupby(df['date'].dt.date)['revenue_eth'].sum().reset_index()
     daily_revenue['date'] = pd.to_datetime(daily_revenue['date'])
     
-    plt.figure(figsize=(14, 6))
-    plt.plot(daily_revenue['date'], daily_revenue['revenue_eth'], marker='o', linewidth=2, markersize=4)
-    plt.title('Daily Liquidation Revenue Trend', fontsize=14, fontweight='bold')
-    plt.xlabel('Date', fontsize=12)
-    plt.ylabel('Revenue (ETH)', fontsize=12)
-    plt.grid(True, alpha=0.3)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.savefig(Path(output_dir) / "daily_revenue_trend.png", dpi=300, bbox_inches='tight')
-    plt.show()
-    
-    # 2. Revenue distribution histogram
-    plt.figure(figsize=(12, 6))
-    plt.hist(df['revenue_eth'], bins=50, alpha=0.7, color='lightcoral', edgecolor='black')
-    plt.title('Revenue Distribution', fontsize=14, fontweight='bold')
-    plt.xlabel('Revenue (ETH)', fontsize=12)
-    plt.ylabel('Frequency', fontsize=12)
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig(Path(output_dir) / "revenue_distribution.png", dpi=300, bbox_inches='tight')
-    plt.show()
+    ax1.plot(daily_revenue['date'], daily_revenue['revenue_eth'], marker='o', linewidth=2, markersize=4)
+    ax1.set_title('Daily Liquidation Revenue Trend', fontsize=14, fontweight='bold')
+    ax1.set_xlabel('Date', fontsize=12)
+    ax1.set_ylabel('Revenue (ETH)', fontsize=12)
+    ax1.grid(True, alpha=0.3)
+    ax1.tick_params(axis='x', labelrotation=45)
+    
+    # 2. Revenue distribution histogram, binned with numpy and clipped at the
+    # 99th percentile so a few outliers do not squash every other bin; missing
+    # (NaN) revenues are left out
+    revenue = df['revenue_eth'].to_numpy()
+    revenue = revenue[np.isfinite(revenue)]
+    if revenue.size:
+        counts, edges = np.histogram(revenue, bins=50, range=(revenue.min(), np.quantile(revenue, 0.99)))
+        ax2.bar(edges[:-1], counts, width=np.diff(edges), align='edge',
+                alpha=0.7, color='lightcoral', edgecolor='black')
+    else:
+        ax2.text(0.5, 0.5, 'No revenue values to plot', ha='center', va='center', transform=ax2.transAxes)
+    ax2.set_title('Revenue Distribution (up to 99th percentile)', fontsize=14, fontweight='bold')
+    ax2.set_xlabel('Revenue (ETH)', fontsize=12)
+    ax2.set_ylabel('Frequency', fontsize=12)
+    ax2.grid(True, alpha=0.3)
+    
+    if fig is None:
+        return
+    
+    # Create output directory
+    Path(output_dir).mkdir(exist_ok=True)
+    
+    # Save both charts with a single layout pass and render
+    fig.tight_layout(pad=1.5)
+    output_path = Path(output_dir) / "additional_charts.png"
+    fig.savefig(output_path, dpi=300, bbox_inches='tight')
+    print(f"Chart saved to: {output_path}")
+    show_and_close(fig)
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Create monthly revenue charts from liquidation data")
+    parser.add_argument('--dataset', choices=['morpho', 'euler'], default='morpho',
+                        help="protocol whose mainnet logs to load (default: morpho)")
+    parser.add_argument('--input', help="path to a *_logs_with_revenue.json file (overrides --dataset)")
+    return parser.parse_args()
 
 def main():
     """Main function"""
+    args = parse_args()
+    input_path = args.input or f"data/mainnet_{args.dataset}_logs_with_revenue.json"
+    
     print("=== LIQUIDATION DATA VISUALIZATION ===\n")
-    data = load_data("data/mainnet_morpho_logs_with_revenue.json")
+    data = load_data(input_path)
     
-    if not data:
+    if data.empty:
         print("No data found. Please ensure the data file exists.")
         return
     
     # Check if data has marketId field (Morpho data)
-    if 'marketId' in data[0]:
+    if 'marketId' in data.columns:
         print("Processing Morpho data with marketId grouping...")
         monthly_data, df, top_5_markets = process_morpho_data(data)
         